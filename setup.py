@@ -6,15 +6,16 @@ import os
 # py2exe - build an exe
 # py2app - build an app
 # cx_freeze - build a linux binary (not implemented)
+# release - zip and tar up the game's source and data for uploading
 #
 # the goods are placed in the dist dir for you to .zip up or whatever...
+#
+# py2exe, py2app, cx_freeze and release remember a hash of their inputs in
+# build/artifact-hashes.json, and skip rebuilding anything that hasn't changed;
+# delete that file to force a rebuild.
 
 
 APP_NAME = 'threadless'
-DESCRIPTION = open('README.txt').read()
-CHANGES = open('CHANGES.txt').read()
-TODO = open('TODO.txt').read()
-
 
 
 METADATA = {
@@ -86,20 +87,54 @@ PACKAGEDATA.update(METADATA)
 
 
 from distutils.core import setup, Extension
+from distutils.command.build_ext import build_ext
+from distutils.errors import CCompilerError, DistutilsExecError, DistutilsPlatformError
 try:
     import py2exe
 except:
     pass
 
+# the compiled AI is optional; threadless.speedups falls back to pure Python
+try:
+    from Cython.Build import cythonize
+except ImportError:
+    cythonize = None
+
+class optional_build_ext(build_ext):
+    '''
+        Builds the speedups extension if there's a working compiler, and carries on
+        without it if there isn't.
+    '''
+
+    def run(self):
+        try:
+            build_ext.run(self)
+        except DistutilsPlatformError as e:
+            self.warn('not building the speedups extension: %s' % e)
+
+    def build_extension(self, ext):
+        try:
+            build_ext.build_extension(self, ext)
+        except (CCompilerError, DistutilsExecError, DistutilsPlatformError) as e:
+            self.warn('could not build %s, using pure Python instead: %s' % (ext.name, e))
+
+cmdclass['build_ext'] = optional_build_ext
+
 import sys
 import glob
+import hashlib
+import json
 import os
 import shutil
+import tarfile
+import zipfile
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
 
 try:
     cmd = sys.argv[1]
 except IndexError:
-    print 'Usage: setup.py install|py2exe|py2app|cx_freeze'
+    print 'Usage: setup.py install|py2exe|py2app|cx_freeze|release'
     raise SystemExit
 
 # utility for adding subdirectories
@@ -113,10 +148,110 @@ def add_files(dest,generator):
             if '~' in name: continue
             suffix = os.path.splitext(name)[1]
             if suffix in ('.pyc', '.pyo'): continue
+            # build outputs of the optional extension; it's built from the .pyx
+            if suffix in ('.so', '.pyd', '.c'): continue
             if name[0] == '.': continue
             filename = os.path.join(dirpath, name)
             dest.append(filename)
 
+def is_excluded(filename):
+    filename = os.path.normpath(filename)
+    for name in files_to_remove:
+        if filename == name or filename.endswith(os.sep + name):
+            return True
+    for name in directories_to_remove:
+        if filename.startswith(name + os.sep) or (os.sep + name + os.sep) in filename:
+            return True
+    return False
+
+HASH_CACHE = os.path.join('build', 'artifact-hashes.json')
+
+def load_hashes():
+    if not os.path.exists(HASH_CACHE):
+        return {}
+    f = open(HASH_CACHE)
+    try:
+        return json.load(f)
+    finally:
+        f.close()
+
+def save_hashes(hashes):
+    if not os.path.isdir('build'):
+        os.mkdir('build')
+    f = open(HASH_CACHE, 'w')
+    try:
+        json.dump(hashes, f, indent=2, sort_keys=True)
+    finally:
+        f.close()
+
+def digest_files(filenames):
+    h = hashlib.sha1()
+    for filename in sorted(filenames):
+        h.update(filename.encode('utf-8') + b'\0')
+        f = open(filename, 'rb')
+        try:
+            for block in iter(lambda: f.read(65536), b''):
+                h.update(block)
+        finally:
+            f.close()
+    return h.hexdigest()
+
+# archive jobs are (archive filename, [(filename, name in archive), ...])
+def write_archive(job):
+    archive, members = job
+    partial = archive + '.partial'
+    if archive.endswith('.zip'):
+        out = zipfile.ZipFile(partial, 'w', zipfile.ZIP_DEFLATED)
+        for filename, arcname in members:
+            out.write(filename, arcname)
+    else:
+        out = tarfile.open(partial, 'w:gz')
+        for filename, arcname in members:
+            out.add(filename, arcname, recursive=False)
+    out.close()
+    if os.path.exists(archive):
+        os.remove(archive)
+    os.rename(partial, archive)
+    return archive
+
+def build_archives(jobs):
+    '''
+        Writes each archive whose inputs have changed since it was last built.  zlib
+        releases the GIL while compressing, so archives are written on separate
+        threads to use several cores.
+    '''
+    hashes = load_hashes()
+    stale = []
+    for archive, members in jobs:
+        digest = digest_files([ filename for filename, arcname in members ])
+        digest = hashlib.sha1(digest + repr(sorted(members))).hexdigest()
+        if os.path.exists(archive) and hashes.get(archive) == digest:
+            print '%s is up to date' % archive
+        else:
+            stale.append((archive, members, digest))
+
+    if not stale:
+        return
+
+    for archive, members, digest in stale:
+        if not os.path.isdir(os.path.dirname(archive)):
+            os.makedirs(os.path.dirname(archive))
+    pool = ThreadPool(min(len(stale), cpu_count()))
+    try:
+        for archive in pool.imap_unordered(write_archive, [ (archive, members) for archive, members, digest in stale ]):
+            print 'wrote %s' % archive
+    finally:
+        pool.close()
+        pool.join()
+
+    for archive, members, digest in stale:
+        hashes[archive] = digest
+    save_hashes(hashes)
+
+def archive_members(root, filenames, base='.'):
+    return [ (filename, os.path.join(root, os.path.relpath(filename, base)))
+             for filename in sorted(set(filenames)) if not is_excluded(filename) ]
+
 # define what is our data
 _DATA_DIR = os.path.join('threadless', 'data')
 data = []
@@ -142,13 +277,47 @@ src.extend(glob.glob('*.py'))
 
 
 
+# skip rebuilding binaries whose inputs haven't changed, as long as the executable
+# itself is still there (py2exe's target is usually just dist/, which is there
+# after any build)
+FROZEN_EXECUTABLES = {
+    'py2exe': os.path.join('dist', METADATA['py2exe.target'], METADATA['py2exe.binary'] + '.exe'),
+    'py2app': os.path.join('dist', METADATA['py2app.target'] + '.app', 'Contents', 'MacOS', METADATA['py2app.target']),
+    'cx_freeze': os.path.join('dist', METADATA['cx_freeze.target'] + '_' + METADATA['version'], METADATA['cx_freeze.binary']),
+}
+if cmd in FROZEN_EXECUTABLES:
+    # the py2exe and py2app builds leave a copy of run_game.py behind
+    frozen_src = [ fname for fname in src
+                   if fname not in (METADATA['py2exe.binary'] + '.py', METADATA['py2app.target'] + '.py') ]
+    frozen_digest = digest_files(frozen_src + data)
+    if os.path.isfile(FROZEN_EXECUTABLES[cmd]) and load_hashes().get(cmd) == frozen_digest:
+        print '%s is up to date' % FROZEN_EXECUTABLES[cmd]
+        raise SystemExit
+
+# build the release archives
+if cmd == 'release':
+    release_name = '%s-%s' % (APP_NAME, METADATA['version'])
+    # stress_test.py is in src, and needs its baselines
+    release_files = list(src) + list(data) + glob.glob('*.md') + ['stress_baselines.json']
+    add_files(release_files, os.walk('data'))
+    add_files(release_files, os.walk('scripts'))
+    members = archive_members(release_name, release_files)
+    build_archives([
+        (os.path.join('dist', release_name + '.zip'), members),
+        (os.path.join('dist', release_name + '.tgz'), members),
+    ])
 
 # build the sdist target
-if cmd not in "py2exe py2app cx_freeze".split():
+if cmd not in "py2exe py2app cx_freeze release".split():
     f = open("MANIFEST.in","w")
     for l in data: f.write("include "+l+"\n")
     for l in src: f.write("include "+l+"\n")
     f.close()
+
+    if cythonize is not None:
+        PACKAGEDATA['ext_modules'] = cythonize([
+            Extension('threadless._speedups', [os.path.join('threadless', '_speedups.pyx')]),
+        ])
     
     setup(**PACKAGEDATA)
 
@@ -235,6 +404,8 @@ def make_dirs(dname_):
 if cmd in ('py2exe','cx_freeze','py2app'):
     dest = data_dir
     for fname in data:
+        if is_excluded(fname):
+            continue
         dname = os.path.join(dest,os.path.dirname(fname))
         make_dirs(dname)
         if not os.path.isdir(fname):
@@ -243,35 +414,29 @@ if cmd in ('py2exe','cx_freeze','py2app'):
 
 # make a tgz files.
 if cmd == 'cx_freeze':
-    sys_cmd = "cd dist; tar -vczf %s.tgz %s/" % (app_dist_dir,app_dist_dir)  
-    os.system(sys_cmd)
-
-
-# remove files from the zip.
-if 0 and cmd in ('py2exe'):
-    import shutil
-
-    #shutil.rmtree( os.path.join('dist') )
-    #shutil.rmtree( os.path.join('build') )
-
-
-    os.system("unzip dist/library.zip -d dist\library")
-
-    for fn in files_to_remove:
-        os.remove( os.path.join('dist', 'library', fn) )
-
-
-    for d in directories_to_remove:
-        if os.path.exists( os.path.join('dist', 'library', d) ):
-            shutil.rmtree( os.path.join('dist', 'library', d) )
-
-    os.remove( os.path.join('dist', 'library.zip') )
-
-
-    os.chdir("dist")
-    os.chdir("library")
-
-    os.system("zip -r -9 ..\library.zip .")
-
-    os.chdir("..")
-    os.chdir("..")
+    frozen_files = [ os.path.join(dirpath, name)
+                     for dirpath, dirnames, filenames in os.walk(dist_dir)
+                     for name in filenames ]
+    build_archives([
+        (os.path.join('dist', app_dist_dir + '.tgz'), archive_members(app_dist_dir, frozen_files, dist_dir)),
+    ])
+
+
+# remove files from the zip, by copying everything else into a fresh one rather
+# than unpacking it, deleting and zipping it back up.
+library_zip = os.path.join('dist', 'library.zip')
+if cmd in ('py2exe',) and os.path.exists(library_zip):
+    old = zipfile.ZipFile(library_zip)
+    new = zipfile.ZipFile(library_zip + '.partial', 'w', zipfile.ZIP_DEFLATED)
+    for info in old.infolist():
+        if not is_excluded(info.filename.replace('/', os.sep)):
+            new.writestr(info, old.read(info.filename))
+    new.close()
+    old.close()
+    os.remove(library_zip)
+    os.rename(library_zip + '.partial', library_zip)
+
+if cmd in FROZEN_EXECUTABLES:
+    hashes = load_hashes()
+    hashes[cmd] = frozen_digest
+    save_hashes(hashes)
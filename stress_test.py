@@ -0,0 +1,299 @@
+'''
+Stress tests for the game's hot paths.
+
+Runs scripted, headless scenarios, each in a fresh process, and measures ticks per
+second, 99th percentile tick latency and peak memory use.  These are compared
+against stress_baselines.json, and the run fails if any scenario has got worse by
+more than the allowed tolerance.  Timings are recorded in units of how long a fixed
+calibration workload takes on the machine that ran them, so baselines recorded on
+one machine still hold on another that's faster or slower:
+
+    python stress_test.py [-u|--update] [-t|--tolerance 0.25] [scenario ...]
+'''
+
+from __future__ import print_function
+
+import getopt
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import time
+
+from threadless.__main__ import Game, HeadlessScreen, YoureDead, line
+
+BASELINES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'stress_baselines.json')
+
+# how much worse than its baseline a scenario may get before the run fails; memory
+# use is much less noisy than timing, so it's held to a tighter bound
+DEFAULT_TOLERANCE = 0.25
+RSS_TOLERANCE     = 0.10
+
+# p99 latencies under a millisecond are mostly timer and scheduler jitter, so
+# latency regressions smaller than this are let through
+LATENCY_SLACK_MS = 1.0
+
+# frame rates to report the share of over-budget ticks for
+FRAME_RATES = (30, 60, 120)
+
+# the calibration workload is timed this many times both before and after each
+# scenario, and the fastest run used, so that a burst of load from elsewhere on the
+# machine doesn't count against it
+CALIBRATION_ROUNDS = 5
+
+# --update records the median of this many runs of each scenario; a check reruns a
+# scenario that regressed up to this many times in all, and compares the best of
+# each measurement across the runs
+UPDATE_RUNS = 3
+CHECK_RUNS  = 3
+
+class Point(object):
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+def calibration_workload():
+    '''
+        The same sort of attribute, tuple, dict and arithmetic work that a tick does,
+        but none of the game's code, so that changes to the game don't move it.
+    '''
+    # small enough not to show up in the scenarios' peak memory use
+    points = [ Point(i % 17, i % 13) for i in range(200) ]
+    seen   = {}
+    total  = 0
+    for _ in range(200):
+        for p in points:
+            key = (p.x, p.y)
+            seen[key] = seen.get(key, 0) + 1
+            total += abs(p.x - 8) + abs(p.y - 6)
+            p.x = (p.x + 1) % 17
+    return total
+
+def calibrate():
+    '''
+        Returns how many seconds the calibration workload takes on this machine.
+    '''
+    best = None
+    for _ in range(CALIBRATION_ROUNDS):
+        start = time.time()
+        calibration_workload()
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+def make_game(width, height, enemies, seed=0):
+    game = Game(screen=HeadlessScreen(width, height), seed=seed)
+    game.SPAWN_COUNT = enemies
+    for _ in game.spawn_enemies():
+        pass
+    game.SPAWN_COUNT = Game.SPAWN_COUNT
+    return game
+
+def every_tick(game, *tickers):
+    '''
+        Replaces game's tickers with the given ones, run on every tick.
+    '''
+    game.tickers = []
+    for ticker in tickers:
+        game.add_ticker(ticker)
+
+def crowd(width, height, enemies):
+    def setup():
+        game = make_game(width, height, enemies)
+        every_tick(game, game.move_enemies, game.check_for_player_death)
+        return game
+    return setup
+
+def maze():
+    game = make_game(200, 100, 500)
+    # every other column is a wall, with a gap in a different place in each
+    for x in range(4, 196, 2):
+        gap = game.random.randint(0, 99)
+        game.place_blocks([ (x, y) for x, y in line(x, 0, x, 99) if abs(y - gap) > 2 ])
+    every_tick(game, game.move_enemies, game.check_for_player_death)
+    return game
+
+def long_session():
+    game = make_game(200, 100, 0)
+    game.SPAWN_COUNT = 50
+    game.tickers = []
+    game.add_ticker(game.move_enemies, every=1/3.0)
+    game.add_ticker(game.spawn_enemies, every=0.5)
+    game.add_ticker(game.check_for_player_death)
+    return game
+
+# name -> (setup, ticks)
+SCENARIOS = {
+    'enemies-10':   (crowd(80, 24, 10),          5000),
+    'enemies-1k':   (crowd(200, 100, 1000),      1000),
+    'enemies-50k':  (crowd(1000, 1000, 50000),    100),
+    'block-maze':   (maze,                       1000),
+    'long-session': (long_session,              5000),
+}
+
+def peak_rss_kb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        rss //= 1024 # bytes there, kilobytes everywhere else
+    return rss
+
+def run_scenario(name, results):
+    setup, ticks = SCENARIOS[name]
+    calibration = calibrate()
+    game = setup()
+
+    latencies = []
+    for i in range(ticks):
+        start = time.time()
+        try:
+            game.tick(budget=float('inf'))
+        except YoureDead:
+            # being caught isn't the point; move the player and carry on
+            width, height = game.screen.get_size()
+            game.player.x = game.random.randint(0, width - 2)
+            game.player.y = game.random.randint(0, height - 1)
+        latencies.append(time.time() - start)
+
+    calibration = min(calibration, calibrate())
+
+    # over the whole run, so that scenarios that get slower as they go, like
+    # long-session, are measured all the way through
+    ticks_per_sec = len(latencies) / sum(latencies)
+    latencies.sort()
+    p99 = latencies[min(int(len(latencies) * 0.99), len(latencies) - 1)]
+    results.put({
+        'calibration_ms': calibration * 1000,
+        'ticks_per_sec':  ticks_per_sec,
+        'p99_ms':         p99 * 1000,
+        # what's compared against the baselines
+        'ticks_per_unit': ticks_per_sec * calibration,
+        'p99_units':      p99 / calibration,
+        'peak_rss_kb':    peak_rss_kb(),
+        'over_budget':    dict(
+            (str(rate), sum(1 for l in latencies if l > 1.0 / rate) / float(len(latencies)))
+            for rate in FRAME_RATES
+        ),
+    })
+
+def measure(name):
+    # a fresh process per scenario, so each gets its own peak RSS
+    results = multiprocessing.Queue()
+    process = multiprocessing.Process(target=run_scenario, args=(name, results))
+    process.start()
+    result = results.get()
+    process.join()
+    return result
+
+def median_result(results):
+    '''
+        Combines several results for one scenario, taking the median of each
+        measurement.
+    '''
+    combined = {}
+    for key in results[0]:
+        if key != 'over_budget':
+            combined[key] = sorted(result[key] for result in results)[len(results) // 2]
+    combined['over_budget'] = dict(
+        (rate, sorted(result['over_budget'][rate] for result in results)[len(results) // 2])
+        for rate in results[0]['over_budget']
+    )
+    return combined
+
+def best_result(results):
+    '''
+        Combines several results for one scenario, taking the best of each
+        measurement.
+    '''
+    best = dict(max(results, key=lambda result: result['ticks_per_unit']))
+    p99  = min(results, key=lambda result: result['p99_units'])
+    best['p99_ms']      = p99['p99_ms']
+    best['p99_units']   = p99['p99_units']
+    best['peak_rss_kb'] = min(result['peak_rss_kb'] for result in results)
+    return best
+
+def regressions(result, baseline, tolerance):
+    '''
+        Compares a result against its baseline.  Timings are compared in calibration
+        units, but reported in this machine's terms.
+    '''
+    problems = []
+    calibration = result['calibration_ms'] / 1000
+    if result['ticks_per_unit'] < baseline['ticks_per_unit'] * (1 - tolerance):
+        problems.append('ticks/s %.1f < %.1f' % (
+            result['ticks_per_sec'], baseline['ticks_per_unit'] / calibration))
+    slack = LATENCY_SLACK_MS / 1000 / calibration
+    if result['p99_units'] > baseline['p99_units'] * (1 + tolerance) + slack:
+        problems.append('p99 %.2fms > %.2fms' % (
+            result['p99_ms'], baseline['p99_units'] * calibration * 1000))
+    if result['peak_rss_kb'] > baseline['peak_rss_kb'] * (1 + RSS_TOLERANCE):
+        problems.append('peak RSS %dKB > %dKB' % (result['peak_rss_kb'], baseline['peak_rss_kb']))
+    return problems
+
+def load_baselines():
+    if not os.path.exists(BASELINES):
+        return {}
+    f = open(BASELINES)
+    try:
+        return json.load(f)
+    finally:
+        f.close()
+
+def save_baselines(baselines):
+    f = open(BASELINES, 'w')
+    try:
+        json.dump(baselines, f, indent=2, sort_keys=True, separators=(',', ': '))
+        f.write('\n')
+    finally:
+        f.close()
+
+def main():
+    optlist, args = getopt.getopt(sys.argv[1:], 'ut:', ['update', 'tolerance='])
+    update    = False
+    tolerance = DEFAULT_TOLERANCE
+    for opt, value in optlist:
+        if opt in ('-u', '--update'):
+            update = True
+        elif opt in ('-t', '--tolerance'):
+            tolerance = float(value)
+
+    names = args or sorted(SCENARIOS)
+    for name in names:
+        if name not in SCENARIOS:
+            print('unknown scenario %s; pick from %s' % (name, ', '.join(sorted(SCENARIOS))))
+            return 2
+
+    baselines = load_baselines()
+    failed = False
+    for name in names:
+        if update:
+            result = median_result([ measure(name) for _ in range(UPDATE_RUNS) ])
+        else:
+            result = measure(name)
+            if 'ticks_per_unit' in baselines.get(name, {}):
+                runs = [ result ]
+                while len(runs) < CHECK_RUNS and regressions(result, baselines[name], tolerance):
+                    runs.append(measure(name))
+                    result = best_result(runs)
+        print('%-14s %9.1f ticks/s  p99 %8.2fms  peak RSS %7dKB  calibration %5.1fms  over budget at %s' % (
+            name, result['ticks_per_sec'], result['p99_ms'], result['peak_rss_kb'], result['calibration_ms'],
+            ', '.join('%sfps %d%%' % (rate, result['over_budget'][str(rate)] * 100) for rate in FRAME_RATES)))
+
+        if update:
+            baselines[name] = dict((key, result[key]) for key in ('ticks_per_unit', 'p99_units', 'peak_rss_kb'))
+        elif 'ticks_per_unit' not in baselines.get(name, {}):
+            # missing, or recorded in seconds before timings were calibrated
+            print('    no baseline; record one with --update')
+        else:
+            problems = regressions(result, baselines[name], tolerance)
+            for problem in problems:
+                print('    REGRESSION: %s' % problem)
+            failed = failed or bool(problems)
+
+    if update:
+        save_baselines(baselines)
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
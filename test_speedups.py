@@ -0,0 +1,173 @@
+'''
+Checks the pure Python speedups against some hand-worked moves, and that the
+compiled speedups make exactly the same moves as the pure Python ones on randomly
+generated grids and crowds.  The comparison is skipped unless the extension has
+been built:
+
+    python setup.py build_ext --inplace
+    python -m unittest test_speedups
+'''
+
+from array import array
+import random
+import unittest
+
+from threadless.__main__ import Crowd
+from threadless import speedups
+
+try:
+    from threadless import _speedups
+except ImportError:
+    _speedups = None
+
+ROUNDS = 20000
+
+def random_grid(rand):
+    width  = rand.randint(3, 30)
+    height = rand.randint(2, 30)
+    density = rand.random() * 0.5
+    cells = bytearray(1 if rand.random() < density else 0 for _ in range(width * height))
+    return cells, width, height
+
+def open_grid(width, height, blocks=()):
+    cells = bytearray(width * height)
+    for x, y in blocks:
+        cells[y * width + x] = 1
+    return cells
+
+class PureSpeedupsTest(unittest.TestCase):
+    def next_move(self, width, height, x, y, player_x, player_y, previous_positions=(), blocks=()):
+        return speedups.py_calculate_next_move(open_grid(width, height, blocks), width, height,
+            x, y, player_x, player_y, list(previous_positions), 1, 5)
+
+    def test_heads_for_the_player(self):
+        self.assertEqual(self.next_move(5, 5, 2, 2, 4, 2), [3, 2])
+        self.assertEqual(self.next_move(5, 5, 2, 2, 2, 0), [2, 1])
+
+    def test_goes_round_blocks(self):
+        # up and down score the same; up is tried first
+        self.assertEqual(self.next_move(5, 5, 2, 2, 4, 2, blocks=[(3, 2)]), [2, 1])
+        self.assertEqual(self.next_move(5, 5, 2, 2, 4, 2, blocks=[(3, 2), (2, 1)]), [2, 3])
+
+    def test_avoids_backtracking(self):
+        # going back to (3, 2) costs 1 + 5; carrying on to (1, 2) costs 3 - 1 for
+        # momentum, which beats up and down at sqrt(5)
+        self.assertEqual(self.next_move(5, 5, 2, 2, 4, 2, previous_positions=[(3, 2)]), [1, 2])
+
+    def test_stays_off_the_last_column(self):
+        self.assertEqual(self.next_move(5, 5, 3, 2, 4, 2), [3, 1])
+
+    def test_trapped(self):
+        self.assertEqual(self.next_move(3, 2, 0, 0, 1, 1, blocks=[(1, 0), (0, 1)]), None)
+
+    def test_permit_movement(self):
+        cells = open_grid(4, 3, [(1, 1)])
+        permitted = [ (x, y) for y in range(-1, 4) for x in range(-1, 5)
+                      if speedups.py_permit_movement(cells, 4, 3, x, y) ]
+        self.assertEqual(permitted, [ (0, 0), (1, 0), (2, 0), (0, 1), (2, 1), (0, 2), (1, 2), (2, 2) ])
+
+@unittest.skipIf(_speedups is None, 'threadless._speedups has not been built')
+class CompiledSpeedupsTest(unittest.TestCase):
+    def setUp(self):
+        self.random = random.Random(0)
+
+    def test_permit_movement(self):
+        rand = self.random
+        for _ in range(ROUNDS):
+            cells, width, height = random_grid(rand)
+            x = rand.randint(-2, width + 1)
+            y = rand.randint(-2, height + 1)
+            self.assertEqual(
+                bool(_speedups.permit_movement(cells, width, height, x, y)),
+                bool(speedups.py_permit_movement(cells, width, height, x, y)),
+                (width, height, x, y))
+
+    def test_calculate_next_move(self):
+        rand = self.random
+        for _ in range(ROUNDS):
+            cells, width, height = random_grid(rand)
+            x = rand.randint(0, width - 1)
+            y = rand.randint(0, height - 1)
+            player_x = rand.randint(0, width - 1)
+            player_y = rand.randint(0, height - 1)
+            previous_positions = [
+                (x + rand.randint(-2, 2), y + rand.randint(-2, 2))
+                for _ in range(rand.randint(0, 5))
+            ]
+            momentum_bonus    = rand.choice((0, 1, 2.5))
+            backtrack_penalty = rand.choice((0, 5, 0.5))
+
+            args = (cells, width, height, x, y, player_x, player_y, previous_positions,
+                    momentum_bonus, backtrack_penalty)
+            self.assertEqual(_speedups.calculate_next_move(*args),
+                             speedups.py_calculate_next_move(*args), args[1:])
+
+    def random_crowd(self, width, height):
+        rand  = self.random
+        crowd = Crowd(5)
+        for _ in range(rand.randint(1, 50)):
+            crowd.add(rand.randint(0, width - 1), rand.randint(0, height - 1))
+        for i in range(len(crowd)):
+            for _ in range(rand.randint(0, 8)):
+                crowd.remember(i)
+                crowd.xs[i] += rand.randint(-1, 1)
+                crowd.ys[i] += rand.randint(-1, 1)
+        return crowd
+
+    def copy_crowd(self, crowd):
+        copy = Crowd(crowd.memory_length)
+        for name in ('xs', 'ys', 'history_xs', 'history_ys', 'history_lens'):
+            setattr(copy, name, array('i', getattr(crowd, name)))
+        return copy
+
+    def crowd_state(self, crowd):
+        return [ list(getattr(crowd, name))
+                 for name in ('xs', 'ys', 'history_xs', 'history_ys', 'history_lens') ]
+
+    def test_move_enemies(self):
+        rand = self.random
+        for _ in range(ROUNDS // 10):
+            cells, width, height = random_grid(rand)
+            crowd   = self.random_crowd(width, height)
+            indices = array('i', rand.sample(range(len(crowd)), rand.randint(0, len(crowd))))
+            start   = rand.randint(0, len(indices))
+            stop    = rand.randint(start, len(indices))
+            args    = (rand.randint(0, width - 1), rand.randint(0, height - 1),
+                       rand.random() < 0.5, rand.choice((0, 1, 2.5)), rand.choice((0, 5, 0.5)))
+
+            compiled = self.copy_crowd(crowd)
+            for turn in range(3):
+                _speedups.move_enemies(cells, width, height, compiled, indices, start, stop, *args)
+                speedups.py_move_enemies(cells, width, height, crowd, indices, start, stop, *args)
+                self.assertEqual(self.crowd_state(compiled), self.crowd_state(crowd))
+
+    def test_find_enemy_at(self):
+        rand = self.random
+        for _ in range(ROUNDS // 10):
+            xs = array('i', [ rand.randint(0, 9) for _ in range(rand.randint(0, 30)) ])
+            ys = array('i', [ rand.randint(0, 9) for _ in range(len(xs)) ])
+            x, y = rand.randint(0, 9), rand.randint(0, 9)
+            self.assertEqual(_speedups.find_enemy_at(xs, ys, x, y),
+                             speedups.py_find_enemy_at(xs, ys, x, y))
+
+    def test_bucket_enemies(self):
+        rand = self.random
+        for _ in range(ROUNDS // 10):
+            xs = array('i', [ rand.randint(0, 300) for _ in range(rand.randint(0, 100)) ])
+            ys = array('i', [ rand.randint(0, 300) for _ in range(len(xs)) ])
+            radii  = sorted(rand.sample(range(200), rand.randint(0, 3))) + [ rand.choice((-1, 250)) ]
+            everys = [ rand.randint(1, 4) for _ in radii ]
+            start  = rand.randint(0, len(xs))
+            stop   = rand.randint(start, len(xs))
+            player_x, player_y = rand.randint(0, 300), rand.randint(0, 300)
+
+            buckets = []
+            for compiled in (True, False):
+                tiers = [ [ array('i') for _ in range(every) ] for every in everys ]
+                bucket_enemies = _speedups.bucket_enemies if compiled else speedups.py_bucket_enemies
+                bucket_enemies(xs, ys, start, stop, player_x, player_y, radii, tiers)
+                buckets.append([ [ list(phase) for phase in phases ] for phases in tiers ])
+            self.assertEqual(buckets[0], buckets[1])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+'''
+Checks that the event log's ring buffer wraps around and accounts for what it
+drops:
+
+    python -m unittest test_telemetry
+'''
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from threadless import telemetry
+
+class EventLogTest(unittest.TestCase):
+    CAPACITY = 16
+
+    def setUp(self):
+        self.dir  = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'events')
+        self.log  = telemetry.EventLog(self.path, capacity=self.CAPACITY, flush_interval=3600)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def stop_flusher(self):
+        # so that only the test decides when records are written out
+        self.log.is_running = False
+        self.log.wakeup.set()
+        self.log.thread.join()
+
+    def test_wraparound(self):
+        self.stop_flusher()
+        for i in range(self.CAPACITY * 3 + 5):
+            self.log.log(telemetry.SPAWN, i, 0, i)
+        self.log.close()
+
+        events = list(telemetry.read_events(self.path))
+        self.assertEqual(events[0][1], 'dropped')
+        self.assertEqual(events[0][4], self.CAPACITY * 2 + 5)
+        # the newest records survive, in order
+        self.assertEqual([ value for _, event, _, _, value in events[1:] ],
+                         list(range(self.CAPACITY * 2 + 5, self.CAPACITY * 3 + 5)))
+        timestamps = [ timestamp for timestamp, _, _, _, _ in events ]
+        self.assertEqual(timestamps, sorted(timestamps))
+
+    def test_drops_across_flushes(self):
+        self.stop_flusher()
+        logged = 0
+        for batch in (self.CAPACITY + 3, self.CAPACITY // 2, self.CAPACITY * 2):
+            for i in range(batch):
+                self.log.log(telemetry.SPAWN, value=logged)
+                logged += 1
+            self.log.flush()
+        self.log.close()
+
+        events = list(telemetry.read_events(self.path))
+        kept    = [ value for _, event, _, _, value in events if event == 'spawn' ]
+        dropped = sum(value for _, event, _, _, value in events if event == 'dropped')
+        self.assertEqual(len(kept) + dropped, logged)
+        self.assertEqual(kept, sorted(kept))
+        timestamps = [ timestamp for timestamp, _, _, _, _ in events ]
+        self.assertEqual(timestamps, sorted(timestamps))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,14 +1,23 @@
 from __future__ import print_function
 
 from abc import abstractmethod, ABCMeta
+from array import array
+from collections import deque, namedtuple
 import curses
+import fcntl
 import logging
-import math
-import operator
+import os
 import random
+import select
+import struct
+import sys
+import termios
+import threading
 import time
+import tty
+import types
 
-logging.basicConfig(filename='threadless.log', level=logging.DEBUG)
+from threadless import speedups, telemetry
 
 class YoureDead(Exception):
     def __init__(self):
@@ -52,51 +61,220 @@ class Player(Positional):
     pass
 
 class Enemy(Positional):
+    '''
+        An enemy's position and the positions it remembers are kept in its game's
+        Crowd, so that threadless.speedups can move many enemies at once; this is
+        a view onto its place there.
+    '''
+
     MEMORY_LENGTH = 5
     BACKTRACK_PENALTY = 5
     MOMENTUM_BONUS = 1
 
-    def __init__(self, *args, **kwargs):
-        super(Enemy, self).__init__(*args, **kwargs)
-        self.previous_positions = []
+    def __init__(self, x, y, movement_checker):
+        self.crowd = movement_checker.crowd
+        self.index = self.crowd.add(x, y)
+        self.movement_checker = movement_checker
 
-    def move_rel(self, dx, dy):
-        current_position = self.getpos()
-        self.previous_positions.append(current_position)
-        if len(self.previous_positions) > self.MEMORY_LENGTH:
-            self.previous_positions.pop(0)
-        super(Enemy, self).move_rel(dx, dy)
+    @property
+    def x(self):
+        return self.crowd.xs[self.index]
 
-    def calculate_next_move(self):
-        x, y = self.getpos()
-        player_x, player_y = self.movement_checker.player.getpos() # XXX not ideal
-        possible_moves = [
-            [x + dx, y + dy, 0] for dx, dy in ((-1, 0), (1, 0), (0, -1), (0, 1))
-        ]
-        possible_moves = [ move for move in possible_moves if self.movement_checker.permit_movement(self, move[0], move[1]) ]
+    @x.setter
+    def x(self, x):
+        self.crowd.xs[self.index] = x
 
-        if not possible_moves:
-            return None
+    @property
+    def y(self):
+        return self.crowd.ys[self.index]
 
-        for move in possible_moves:
-            new_x, new_y, score = move
-            score = math.sqrt(abs(new_x - player_x) ** 2 + abs(new_y - player_y) ** 2)
+    @y.setter
+    def y(self, y):
+        self.crowd.ys[self.index] = y
 
-            if self.previous_positions:
-                previous_position = self.previous_positions[-1]
-                dx = abs(previous_position[0] - new_x)
-                dy = abs(previous_position[1] - new_y)
+    @property
+    def previous_positions(self):
+        return self.crowd.previous_positions(self.index)
 
-                if dx == 2 or dy == 2:
-                    score -= self.MOMENTUM_BONUS
+    def move_rel(self, dx, dy):
+        self.crowd.remember(self.index)
+        super(Enemy, self).move_rel(dx, dy)
 
-            for prev_x, prev_y in self.previous_positions:
-                if new_x == prev_x and new_y == prev_y:
-                    score += self.BACKTRACK_PENALTY
-                    break # we might weight positions further back differently
-            move[2] = score
-        best_move = min(possible_moves, key=operator.itemgetter(2))
-        return best_move[0:2]
+    def calculate_next_move(self):
+        x, y = self.getpos()
+        player_x, player_y = self.movement_checker.player.getpos() # XXX not ideal
+        grid = self.movement_checker.grid
+        return speedups.calculate_next_move(grid.cells, grid.width, grid.height,
+            x, y, player_x, player_y, self.previous_positions,
+            self.MOMENTUM_BONUS, self.BACKTRACK_PENALTY)
+
+class Crowd(object):
+    '''
+        The positions of every enemy in a game, as typed arrays indexed by
+        Enemy.index, along with the last Enemy.MEMORY_LENGTH positions each one
+        moved from (oldest first) for the AI to avoid backtracking.
+    '''
+
+    def __init__(self, memory_length):
+        self.memory_length = memory_length
+        self.xs = array('i')
+        self.ys = array('i')
+        self.history_xs   = array('i')
+        self.history_ys   = array('i')
+        self.history_lens = array('i')
+
+    def add(self, x, y):
+        '''
+            Adds an enemy at the given position, and returns its index.
+        '''
+        self.xs.append(x)
+        self.ys.append(y)
+        self.history_xs.extend([0] * self.memory_length)
+        self.history_ys.extend([0] * self.memory_length)
+        self.history_lens.append(0)
+        return len(self.xs) - 1
+
+    def remember(self, i):
+        '''
+            Adds enemy i's current position to its memory, forgetting the oldest
+            one if its memory is full.
+        '''
+        base  = i * self.memory_length
+        count = self.history_lens[i]
+        if count == self.memory_length:
+            self.history_xs[base:base + count - 1] = self.history_xs[base + 1:base + count]
+            self.history_ys[base:base + count - 1] = self.history_ys[base + 1:base + count]
+            count -= 1
+        self.history_xs[base + count] = self.xs[i]
+        self.history_ys[base + count] = self.ys[i]
+        self.history_lens[i] = count + 1
+
+    def previous_positions(self, i):
+        base  = i * self.memory_length
+        count = self.history_lens[i]
+        return list(zip(self.history_xs[base:base + count], self.history_ys[base:base + count]))
+
+    def __len__(self):
+        return len(self.xs)
+
+# radius - how far (in cells, along either axis) from the player this tier reaches;
+#          None for no limit
+# every  - enemies in this tier move on every Nth run of move_enemies
+# smart  - whether to use the full scoring AI, or just step straight at the player
+AITier = namedtuple('AITier', 'radius every smart')
+
+class BlockGrid(object):
+    '''
+        Keeps track of where blocks are, both as a set of positions and as a bitmap
+        (one byte per cell, row by row) for threadless.speedups to check movement
+        against.  Blocks are added and removed in batches, so that building a wall
+        touches the bitmap once per cell and nothing else.
+    '''
+
+    def __init__(self, width, height):
+        self.positions = set()
+        self.resize(width, height)
+
+    def resize(self, width, height):
+        self.width  = width
+        self.height = height
+        self.cells  = bytearray(width * height)
+        self.mark(self.positions, 1)
+
+    def add_many(self, positions):
+        '''
+            Adds blocks at the given positions, and returns the ones that weren't
+            already there, in order.
+        '''
+        added = []
+        for position in positions:
+            if position not in self.positions:
+                self.positions.add(position)
+                added.append(position)
+        self.mark(added, 1)
+        return added
+
+    def remove_many(self, positions):
+        '''
+            Removes blocks from the given positions, and returns the ones that had
+            a block to remove, in order.
+        '''
+        removed = []
+        for position in positions:
+            if position in self.positions:
+                self.positions.remove(position)
+                removed.append(position)
+        self.mark(removed, 0)
+        return removed
+
+    def mark(self, positions, value):
+        cells  = self.cells
+        width  = self.width
+        height = self.height
+        for x, y in positions:
+            if 0 <= x < width and 0 <= y < height:
+                cells[y * width + x] = value
+
+    def __contains__(self, position):
+        return position in self.positions
+
+    def __len__(self):
+        return len(self.positions)
+
+# Shapes for building with Game.place_blocks and clearing with Game.remove_blocks;
+# each returns a list of positions, corners included.
+
+def line(x0, y0, x1, y1):
+    '''
+        The cells on a straight line between two points (Bresenham's algorithm).
+    '''
+    dx = abs(x1 - x0)
+    dy = -abs(y1 - y0)
+    step_x = 1 if x0 < x1 else -1
+    step_y = 1 if y0 < y1 else -1
+    error = dx + dy
+
+    positions = []
+    x, y = x0, y0
+    while True:
+        positions.append((x, y))
+        if x == x1 and y == y1:
+            return positions
+        doubled = 2 * error
+        if doubled >= dy:
+            error += dy
+            x += step_x
+        if doubled <= dx:
+            error += dx
+            y += step_y
+
+def rectangle(x0, y0, x1, y1):
+    '''
+        The outline of the rectangle with the given opposite corners.
+    '''
+    left, right = min(x0, x1), max(x0, x1)
+    top, bottom = min(y0, y1), max(y0, y1)
+
+    positions = [ (x, top) for x in range(left, right + 1) ]
+    if bottom != top:
+        positions.extend((x, bottom) for x in range(left, right + 1))
+    for y in range(top + 1, bottom):
+        positions.append((left, y))
+        if right != left:
+            positions.append((right, y))
+    return positions
+
+def filled_rectangle(x0, y0, x1, y1):
+    '''
+        Every cell of the rectangle with the given opposite corners.
+    '''
+    return [ (x, y)
+             for y in range(min(y0, y1), max(y0, y1) + 1)
+             for x in range(min(x0, x1), max(x0, x1) + 1) ]
+
+# a snapshot of everything on a screen, for rendering; entities are
+# (object id, char, x, y) tuples
+Frame = namedtuple('Frame', 'width height entities')
 
 class Screen(object):
     Q = 1
@@ -110,19 +288,44 @@ class Screen(object):
     D = 9
     E = 10
 
+    CHAR_FOR_TYPE = {
+        Player:      'P',
+        Enemy:       'E',
+        StoneBlock:  'X',
+    }
+
     __metaclass__ = ABCMeta
 
-    @abstractmethod
     def draw(self):
         '''
             Draws things on the screen.
         '''
+        self.render(self.snapshot())
+
+    def snapshot(self):
+        '''
+            Returns a Frame of the objects added to the screen, as they are right now.
+            Implementations keep their objects in self.objects.
+        '''
+        width, height = self.get_size()
+        char_for_type = self.CHAR_FOR_TYPE
+        return Frame(width, height, tuple(
+            (id(obj), char_for_type[type(obj)], obj.x, obj.y) for obj in self.objects
+        ))
+
+    @abstractmethod
+    def render(self, frame):
+        '''
+            Draws a Frame on the screen.  This may be called from a RenderThread rather
+            than the thread that processes input.
+        '''
         pass
 
     @abstractmethod
     def get_size(self):
         '''
-            Returns the width and height of the screen.
+            Returns the width and height of the screen.  This is called once per
+            tick, so it should be cheap.
         '''
         pass
 
@@ -150,6 +353,14 @@ class Screen(object):
         '''
         pass
 
+    def remove_objects(self, objs):
+        '''
+            Stops drawing the given objects.  Takes several at once, since removing
+            them means rebuilding self.objects.
+        '''
+        doomed = set(id(obj) for obj in objs)
+        self.objects = [ obj for obj in self.objects if id(obj) not in doomed ]
+
     def teardown(self):
         pass
 
@@ -168,12 +379,6 @@ class CursesScreen(Screen):
         Screen.W: ord('w'),
     }
 
-    CHAR_FOR_TYPE = {
-        Player:      'P',
-        Enemy:       'E',
-        StoneBlock:  'X',
-    }
-
     def __init__(self):
         self.screen = curses.initscr()
         curses.noecho()
@@ -182,6 +387,13 @@ class CursesScreen(Screen):
         self.screen.keypad(1)
         self.cursor_state = curses.curs_set(0)
 
+        # curses isn't thread safe, so once the game is running, only render()
+        # touches it: it reads the keys and the window size for the game to pick
+        # up from here
+        self.keys = deque()
+        height, width = self.screen.getmaxyx()
+        self.size = (width, height)
+
         self.keybindings = {}
         self.objects = []
 
@@ -192,16 +404,99 @@ class CursesScreen(Screen):
         curses.echo()
         curses.endwin()
 
-    def draw(self):
+    def render(self, frame):
+        height, width = self.screen.getmaxyx()
+        self.size = (width, height)
+
+        # the terminal may have shrunk since the frame was taken
+        width  = min(width, frame.width)
+        height = min(height, frame.height)
+
         self.screen.erase()
-        for obj in self.objects:
-            x, y = obj.getpos()
-            c    = self.CHAR_FOR_TYPE[type(obj)]
-            self.screen.addch(y, x, c)
+        for _, c, x, y in frame.entities:
+            if 0 <= x < width and 0 <= y < height:
+                try:
+                    self.screen.addch(y, x, c)
+                except curses.error:
+                    # drawing in the bottom-right cell works, but then moving the
+                    # cursor past the end of the window fails
+                    pass
         self.screen.refresh()
 
+        while True:
+            ch = self.screen.getch()
+            if ch == -1:
+                break
+            self.keys.append(ch)
+
     def get_size(self):
-        height, width = self.screen.getmaxyx()
+        return self.size
+
+    def on_key_down(self, key, callback):
+        key = self.KEY_MAP[key]
+        if key not in self.keybindings:
+            self.keybindings[key] = []
+        self.keybindings[key].append(callback)
+
+    def process_input(self):
+        while self.keys:
+            ch = self.keys.popleft()
+            callbacks = self.keybindings.get(ch, [])
+            for cb in callbacks:
+                cb()
+
+    def add_object(self, obj):
+        self.objects.append(obj)
+
+
+class AnsiScreen(Screen):
+    '''
+        Draws with raw ANSI escape codes instead of curses.  Only the cells that
+        changed since the last frame are rewritten, so slow terminals have less to
+        chew on.
+    '''
+
+    KEY_MAP = CursesScreen.KEY_MAP
+
+    def __init__(self, stdin=sys.stdin, stdout=sys.stdout):
+        self.stdin  = stdin
+        self.stdout = stdout
+        self.termios_state = termios.tcgetattr(stdin.fileno())
+        tty.setcbreak(stdin.fileno())
+        self.stdout.write('\x1b[?25l\x1b[2J')
+        self.stdout.flush()
+
+        self.cells = {} # (x, y) -> char, as last drawn
+        self.keybindings = {}
+        self.objects = []
+
+    def teardown(self):
+        self.stdout.write('\x1b[2J\x1b[H\x1b[?25h')
+        self.stdout.flush()
+        termios.tcsetattr(self.stdin.fileno(), termios.TCSADRAIN, self.termios_state)
+
+    def render(self, frame):
+        cells = {}
+        for _, c, x, y in frame.entities:
+            if 0 <= x < frame.width and 0 <= y < frame.height:
+                cells[(x, y)] = c
+
+        out = []
+        for (x, y) in self.cells:
+            if (x, y) not in cells:
+                out.append('\x1b[%d;%dH ' % (y + 1, x + 1))
+        for (x, y), c in cells.items():
+            if self.cells.get((x, y)) != c:
+                out.append('\x1b[%d;%dH%s' % (y + 1, x + 1, c))
+        self.cells = cells
+
+        if out:
+            self.stdout.write(''.join(out))
+            self.stdout.flush()
+
+    def get_size(self):
+        height, width, _, _ = struct.unpack('hhhh',
+            fcntl.ioctl(self.stdout.fileno(), termios.TIOCGWINSZ, struct.pack('hhhh', 0, 0, 0, 0)))
         return width, height
 
     def on_key_down(self, key, callback):
@@ -211,9 +506,12 @@ class CursesScreen(Screen):
         self.keybindings[key].append(callback)
 
     def process_input(self):
-        ch = self.screen.getch()
+        fd = self.stdin.fileno()
+        ready, _, _ = select.select([ fd ], [], [], 0)
+        if not ready:
+            return
 
-        if ch != -1:
+        for ch in bytearray(os.read(fd, 1024)):
             callbacks = self.keybindings.get(ch, [])
             for cb in callbacks:
                 cb()
@@ -222,15 +520,166 @@ class CursesScreen(Screen):
         self.objects.append(obj)
 
 
+class HeadlessScreen(Screen):
+    '''
+        A Screen that draws nothing and reads no input, for games that are simulated
+        without a terminal attached.  Key presses can be scripted with press().
+    '''
+
+    def __init__(self, width=80, height=24):
+        self.width  = width
+        self.height = height
+
+        self.keybindings = {}
+        self.objects = []
+
+    def draw(self):
+        pass
+
+    def render(self, frame):
+        pass
+
+    def get_size(self):
+        return self.width, self.height
+
+    def on_key_down(self, key, callback):
+        if key not in self.keybindings:
+            self.keybindings[key] = []
+        self.keybindings[key].append(callback)
+
+    def process_input(self):
+        pass
+
+    def add_object(self, obj):
+        self.objects.append(obj)
+
+    def press(self, key):
+        for cb in self.keybindings.get(key, []):
+            cb()
+
+
+SCREENS = {
+    'curses': CursesScreen,
+    'ansi':   AnsiScreen,
+    'null':   HeadlessScreen,
+}
+
+
+class RenderThread(object):
+    '''
+        Renders frames on a thread of its own, at its own rate, so that a slow
+        terminal doesn't hold up the simulation.  Only the most recent frame
+        submitted is kept; any that arrive before it gets drawn are dropped.
+
+        If rendering fails, the thread stops, and the error is raised again from
+        the next call to wants_frame() or submit() on the game thread.
+    '''
+
+    def __init__(self, screen, rate=30.0):
+        self.screen = screen
+        self.seconds_per_frame = 1 / rate
+
+        self.frame       = None
+        self.next_render = 0
+        self.ready       = threading.Event()
+        self.is_running  = True
+        self.error       = None # sys.exc_info() of whatever stopped the thread
+
+        self.thread = threading.Thread(target=self.render_forever, name='threadless-render')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def wants_frame(self):
+        '''
+            Whether a frame submitted now would be drawn, so that callers can skip
+            taking snapshots that would only be dropped.
+        '''
+        self.check()
+        return time.time() >= self.next_render
+
+    def submit(self, frame):
+        self.check()
+        self.frame = frame
+        self.ready.set()
+
+    def check(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error[0], error[1], error[2]
+
+    def render_forever(self):
+        while self.is_running:
+            self.ready.wait()
+            self.ready.clear()
+            frame, self.frame = self.frame, None
+            if frame is None:
+                continue
+
+            start = time.time()
+            self.next_render = start + self.seconds_per_frame
+            try:
+                self.screen.render(frame)
+            except Exception:
+                self.error = sys.exc_info()
+                break
+
+            wait_time = self.next_render - time.time()
+            if wait_time > 0:
+                time.sleep(wait_time)
+
+    def stop(self):
+        self.is_running = False
+        self.ready.set()
+        self.thread.join()
+
+
 FRAME_RATE = 60.0
 
 class Game(object):
-    def __init__(self):
+    # checked in order; an enemy uses the first tier whose radius it's within.  The
+    # first tier covers the whole of any ordinary terminal, so that only the far
+    # reaches of very large boards are throttled.
+    AI_TIERS = (
+        AITier(radius=100,  every=1, smart=True),
+        AITier(radius=250,  every=2, smart=True),
+        AITier(radius=None, every=4, smart=False),
+    )
+
+    # enemies stay in the tier they were last sorted into until this many runs of
+    # move_enemies have gone by
+    AI_REBUCKET_EVERY = 3
+
+    SPAWN_COUNT = 10
+
+    # Tickers may be generators, in which case they're resumed a step at a time,
+    # after input and drawing, until this much of the frame has gone by.  Generator
+    # tickers yield after every WORK_CHUNK entities.
+    WORK_BUDGET = 0.5 / FRAME_RATE
+    WORK_CHUNK  = 100
+
+    def __init__(self, screen=None, seed=None, logger=None, ai_tiers=None, events=None,
+                 renderer=None):
         self.is_running = True
+        self.renderer = renderer # draw on the game loop if None
+        if events is None:
+            events = telemetry.NullEventLog()
+        self.events = events
+        self.ai_tiers = ai_tiers or self.AI_TIERS
+        self.ai_tick = 0
+        self.ai_buckets = self.empty_ai_buckets()
+        self.random = random.Random(seed)
+        if logger is None:
+            logger = logging.getLogger('threadless')
+        self.logger = logger
+        self.tick_count = 0
         self.tickers = [
             # (ticker, tick_delay)
         ]
-        self.screen = CursesScreen()
+        self.work = deque() # (ticker, generator)
+        self.busy_tickers = set()
+        if screen is None:
+            screen = CursesScreen()
+        self.screen = screen
 
         width, height = self.screen.get_size()
         x = int(width / 2)
@@ -239,7 +688,9 @@ class Game(object):
         self.screen.add_object(self.player)
 
         self.enemies = []
-        self.blocks  = []
+        self.crowd   = Crowd(Enemy.MEMORY_LENGTH) # where the enemies are
+        self.blocks  = {} # position -> StoneBlock
+        self.grid    = BlockGrid(width, height)
 
         self.screen.on_key_down(Screen.Q, self.stop_running)
         self.screen.on_key_down(Screen.S, self.player.move_down)
@@ -254,106 +705,244 @@ class Game(object):
         self.add_ticker(self.check_for_player_death)
 
     def teardown(self):
+        if self.renderer is not None:
+            self.renderer.stop()
         self.screen.teardown()
 
     def run(self):
         seconds_per_frame = 1 / FRAME_RATE
 
-        tick = 0
         while self.is_running:
             start = time.time()
-            tick += 1
-            self.screen.draw()
-            for ticker, tick_delay in self.tickers:
-                if tick % tick_delay == 0:
-                    ticker()
+            self.tick()
 
             end       = time.time()
             wait_time = seconds_per_frame - (end - start)
             if wait_time > 0:
                 time.sleep(wait_time)
 
+    def tick(self, budget=None):
+        '''
+            Advances the simulation by a single frame.  Callers that drive many games
+            from one loop (see threadless.server) use this instead of run().
+
+            budget is how long to spend on generator tickers' work, defaulting to
+            WORK_BUDGET.
+        '''
+        start = time.time()
+        self.tick_count += 1
+        self.sync_grid()
+        if self.renderer is None:
+            self.screen.draw()
+        elif self.renderer.wants_frame():
+            self.renderer.submit(self.screen.snapshot())
+        for ticker, tick_delay in self.tickers:
+            # a generator ticker that's still working through its last run is left
+            # to finish rather than started over
+            if self.tick_count % tick_delay == 0 and ticker not in self.busy_tickers:
+                work = ticker()
+                if isinstance(work, types.GeneratorType):
+                    self.busy_tickers.add(ticker)
+                    self.work.append((ticker, work))
+
+        if budget is None:
+            budget = self.WORK_BUDGET
+        self.run_work(start + budget)
+
+        overrun = time.time() - start - 1 / FRAME_RATE
+        if overrun > 0:
+            self.events.log(telemetry.FRAME_OVERRUN, value=int(overrun * 1000000))
+
+    def run_work(self, deadline):
+        '''
+            Resumes pending generator tickers in turn until they're all done or the
+            deadline has passed.  At least one step is always taken, so work makes
+            progress even on frames that are already over budget.
+        '''
+        while self.work:
+            ticker, work = self.work.popleft()
+            try:
+                next(work)
+            except StopIteration:
+                self.busy_tickers.discard(ticker)
+            else:
+                self.work.append((ticker, work))
+
+            if time.time() >= deadline:
+                break
+
+    def finish_work(self):
+        '''
+            Runs all pending generator tickers to completion.
+        '''
+        self.run_work(float('inf'))
+
     def stop_running(self):
         self.is_running = False
 
     def move_enemies(self):
+        self.ai_tick += 1
+        if self.ai_tick % self.AI_REBUCKET_EVERY == 0:
+            for _ in self.rebucket_enemies():
+                yield
+
+        # only the enemies due to move on this run are visited at all
+        due = [
+            (tier, phases[self.ai_tick % tier.every])
+            for tier, phases in zip(self.ai_tiers, self.ai_buckets)
+        ]
+        grid = self.grid
+        first = True
+        for tier, indices in due:
+            for start in range(0, len(indices), self.WORK_CHUNK):
+                if not first:
+                    yield
+                first = False
+
+                player_x, player_y = self.player.getpos()
+                speedups.move_enemies(grid.cells, grid.width, grid.height, self.crowd,
+                    indices, start, min(start + self.WORK_CHUNK, len(indices)),
+                    player_x, player_y, tier.smart, Enemy.MOMENTUM_BONUS, Enemy.BACKTRACK_PENALTY)
+
+    def rebucket_enemies(self):
+        '''
+            Sorts every enemy into the bucket for its AI tier, by its distance from
+            the player as of now.  Buckets hold indices into the Crowd, and each
+            tier's is split into one per phase of tier.every, so that throttled
+            enemies don't all move on the same tick.
+        '''
+        buckets = self.empty_ai_buckets()
+        # enemies may spawn while this yields, so go until there are none left
+        start = 0
+        while start < len(self.crowd):
+            if start:
+                yield
+            stop = min(start + self.WORK_CHUNK, len(self.crowd))
+            self.add_to_buckets(buckets, start, stop)
+            start = stop
+        self.ai_buckets = buckets
+
+    def empty_ai_buckets(self):
+        return [ [ array('i') for _ in range(tier.every) ] for tier in self.ai_tiers ]
+
+    def add_to_buckets(self, buckets, start, stop):
         player_x, player_y = self.player.getpos()
-        for enemy in self.enemies:
-            enemy_x, enemy_y = enemy.getpos()
-            next_move = enemy.calculate_next_move()
-            if next_move:
-                enemy.move_rel(next_move[0] - enemy_x, next_move[1] - enemy_y)
+        speedups.bucket_enemies(self.crowd.xs, self.crowd.ys, start, stop, player_x, player_y,
+            [ -1 if tier.radius is None else tier.radius for tier in self.ai_tiers ], buckets)
 
     def add_ticker(self, ticker, every=1/FRAME_RATE):
         assert every != 0
         self.tickers.append((ticker, every * FRAME_RATE))
 
     def spawn_enemies(self):
-        width, height = self.screen.get_size()
-        for i in range(0, 10):
-            side = random.randint(0, 3)
+        width, height = self.grid.width, self.grid.height
+        for i in range(0, self.SPAWN_COUNT):
+            if i and i % self.WORK_CHUNK == 0:
+                yield
+
+            side = self.random.randint(0, 3)
 
             # for some reason, (width - 1, height - 1) as coordinates don't work, so
             # we use width - 2
             if side == 0:
-                x = random.randint(0, width - 2)
+                x = self.random.randint(0, width - 2)
                 y = 0
             elif side == 1:
                 x = width - 1
-                y = random.randint(0, height - 1)
+                y = self.random.randint(0, height - 1)
             elif side == 2:
-                x = random.randint(0, width - 2)
+                x = self.random.randint(0, width - 2)
                 y = height - 1
             elif side == 3:
                 x = 0
-                y = random.randint(0, height - 1)
+                y = self.random.randint(0, height - 1)
 
             enemy = Enemy(x, y, self)
+            self.add_to_buckets(self.ai_buckets, enemy.index, enemy.index + 1)
             self.enemies.append(enemy)
             self.screen.add_object(enemy)
+            self.events.log(telemetry.SPAWN, x, y)
 
     def check_for_player_death(self):
         player_x, player_y = self.player.getpos()
 
-        for enemy in self.enemies:
-            enemy_x, enemy_y = enemy.getpos()
-
-            if player_x == enemy_x and player_y == enemy_y:
-                raise YoureDead()
+        if speedups.find_enemy_at(self.crowd.xs, self.crowd.ys, player_x, player_y) >= 0:
+            self.events.log(telemetry.DEATH, player_x, player_y)
+            raise YoureDead()
 
     def place_block(self):
         x, y = self.player.getpos()
-        width, height = self.screen.get_size()
-        block = StoneBlock(x + 1, y, self)
-        self.blocks.append(block)
-        self.screen.add_object(block)
-
-    def permit_movement(self, obj, x, y):
-        width, height = self.screen.get_size()
-
-        if x < 0 or x >= width - 1:
-            return False
-
-        if y < 0 or y >= height:
-            return False
+        self.place_blocks([ (x + 1, y) ])
 
-        for block in self.blocks:
-            block_x, block_y = block.getpos()
+    def place_blocks(self, positions):
+        '''
+            Puts a StoneBlock at each of the given positions that is on the screen and
+            doesn't already have one; see line(), rectangle() and filled_rectangle()
+            for ways to build them.  Returns how many blocks were placed.
 
-            if x == block_x and y == block_y:
-                return False
+            This and remove_blocks() are for building levels from code; players
+            only get place_block().
+        '''
+        width, height = self.grid.width, self.grid.height
+        added = self.grid.add_many(
+            (x, y) for x, y in positions if 0 <= x < width and 0 <= y < height
+        )
+        for x, y in added:
+            block = StoneBlock(x, y, self)
+            self.blocks[(x, y)] = block
+            self.screen.add_object(block)
+            self.events.log(telemetry.BLOCK_PLACED, x, y)
+        return len(added)
+
+    def remove_blocks(self, positions):
+        '''
+            Takes away the blocks at any of the given positions.  Returns how many
+            were removed.
+        '''
+        removed = self.grid.remove_many(positions)
+        if removed:
+            self.screen.remove_objects([ self.blocks.pop(position) for position in removed ])
+        for x, y in removed:
+            self.events.log(telemetry.BLOCK_REMOVED, x, y)
+        return len(removed)
+
+    def sync_grid(self):
+        '''
+            Makes sure the block grid matches the screen size, in case the terminal
+            has been resized.  Called once per tick; everything else goes by the
+            grid's size.
+        '''
+        width, height = self.screen.get_size()
+        if width != self.grid.width or height != self.grid.height:
+            self.grid.resize(width, height)
 
-        return True
+    def permit_movement(self, obj, x, y):
+        return speedups.permit_movement(self.grid.cells, self.grid.width, self.grid.height, x, y)
 
 def main():
     """ your app starts here
     """
 
+    # routine game events go to the binary event log; see threadless.telemetry
+    logging.basicConfig(filename='threadless.log', level=logging.WARNING)
+    events = telemetry.EventLog('threadless.events')
     try:
-        game = Game()
+        screen = SCREENS[os.environ.get('THREADLESS_SCREEN', 'curses')]()
+        renderer = None
+        try:
+            renderer = RenderThread(screen)
+            game = Game(screen=screen, events=events, renderer=renderer)
+        except:
+            # the game never got far enough to tear these down itself
+            if renderer is not None:
+                renderer.stop()
+            screen.teardown()
+            raise
         try:
             game.run()
         finally:
             game.teardown()
     except YoureDead, _:
         print("You're dead! =(")
+    finally:
+        events.close()
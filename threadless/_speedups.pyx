@@ -0,0 +1,196 @@
+# cython: boundscheck=False, wraparound=False
+'''Compiled versions of the functions in threadless.speedups; see there.'''
+
+from cpython cimport array
+from libc.math cimport sqrt
+from libc.stdlib cimport malloc, free
+
+# in the order calculate_next_move breaks ties
+cdef int DX[4]
+cdef int DY[4]
+DX[0], DX[1], DX[2], DX[3] = -1, 1, 0, 0
+DY[0], DY[1], DY[2], DY[3] = 0, 0, -1, 1
+
+cdef inline bint _permit(unsigned char[:] cells, int width, int height, int x, int y):
+    if x < 0 or x >= width - 1:
+        return False
+
+    if y < 0 or y >= height:
+        return False
+
+    return cells[y * width + x] == 0
+
+def permit_movement(unsigned char[:] cells, int width, int height, int x, int y):
+    return _permit(cells, width, height, x, y)
+
+def calculate_next_move(unsigned char[:] cells, int width, int height, int x, int y,
+                        int player_x, int player_y, list previous_positions,
+                        double momentum_bonus, double backtrack_penalty):
+    cdef Py_ssize_t n = len(previous_positions)
+    cdef Py_ssize_t j
+    cdef int *prev_xs = NULL
+    cdef int *prev_ys = NULL
+
+    if n == 0:
+        return _best_move(cells, width, height, x, y, player_x, player_y,
+                          NULL, NULL, 0, momentum_bonus, backtrack_penalty)
+
+    # unpack the history once, rather than once per candidate move
+    prev_xs = <int *> malloc(n * sizeof(int))
+    prev_ys = <int *> malloc(n * sizeof(int))
+    if prev_xs == NULL or prev_ys == NULL:
+        free(prev_xs)
+        free(prev_ys)
+        raise MemoryError()
+    try:
+        for j in range(n):
+            prev_xs[j], prev_ys[j] = previous_positions[j]
+        return _best_move(cells, width, height, x, y, player_x, player_y,
+                          prev_xs, prev_ys, n, momentum_bonus, backtrack_penalty)
+    finally:
+        free(prev_xs)
+        free(prev_ys)
+
+cdef object _best_move(unsigned char[:] cells, int width, int height, int x, int y,
+                       int player_x, int player_y, int *prev_xs, int *prev_ys,
+                       Py_ssize_t n, double momentum_bonus, double backtrack_penalty):
+    cdef int best_x, best_y
+    if not _choose_move(cells, width, height, x, y, player_x, player_y, prev_xs, prev_ys,
+                        n, momentum_bonus, backtrack_penalty, &best_x, &best_y):
+        return None
+    return [best_x, best_y]
+
+cdef bint _choose_move(unsigned char[:] cells, int width, int height, int x, int y,
+                       int player_x, int player_y, int *prev_xs, int *prev_ys,
+                       Py_ssize_t n, double momentum_bonus, double backtrack_penalty,
+                       int *best_x, int *best_y):
+    cdef int i, new_x, new_y
+    cdef double score, best_score = 0
+    cdef bint found = False
+    cdef Py_ssize_t j
+
+    for i in range(4):
+        new_x = x + DX[i]
+        new_y = y + DY[i]
+        if not _permit(cells, width, height, new_x, new_y):
+            continue
+
+        score = sqrt(<double>((new_x - player_x) * (new_x - player_x) +
+                              (new_y - player_y) * (new_y - player_y)))
+
+        if n:
+            if abs(prev_xs[n - 1] - new_x) == 2 or abs(prev_ys[n - 1] - new_y) == 2:
+                score -= momentum_bonus
+
+        for j in range(n):
+            if new_x == prev_xs[j] and new_y == prev_ys[j]:
+                score += backtrack_penalty
+                break # we might weight positions further back differently
+
+        if not found or score < best_score:
+            best_x[0]  = new_x
+            best_y[0]  = new_y
+            best_score = score
+            found      = True
+
+    return found
+
+def move_enemies(unsigned char[:] cells, int width, int height, crowd,
+                 array.array indices, Py_ssize_t start, Py_ssize_t stop,
+                 int player_x, int player_y, bint smart,
+                 double momentum_bonus, double backtrack_penalty):
+    cdef array.array xs_array = crowd.xs, ys_array = crowd.ys
+    cdef array.array history_xs_array = crowd.history_xs, history_ys_array = crowd.history_ys
+    cdef array.array history_lens_array = crowd.history_lens
+    cdef int *xs = xs_array.data.as_ints
+    cdef int *ys = ys_array.data.as_ints
+    cdef int *history_xs = history_xs_array.data.as_ints
+    cdef int *history_ys = history_ys_array.data.as_ints
+    cdef int *history_lens = history_lens_array.data.as_ints
+    cdef int *enemies = indices.data.as_ints
+    cdef int memory_length = crowd.memory_length
+    cdef Py_ssize_t n, base, j
+    cdef int i, x, y, dx, dy, new_x, new_y, count
+    cdef bint moved
+
+    for n in range(start, stop):
+        i = enemies[n]
+        x = xs[i]
+        y = ys[i]
+
+        moved = False
+        if not smart:
+            dx = player_x - x
+            dy = player_y - y
+            if abs(dx) >= abs(dy):
+                new_x = x + (1 if dx > 0 else -1)
+                new_y = y
+            else:
+                new_x = x
+                new_y = y + (1 if dy > 0 else -1)
+            moved = _permit(cells, width, height, new_x, new_y)
+
+        base  = i * memory_length
+        count = history_lens[i]
+        if not moved:
+            moved = _choose_move(cells, width, height, x, y, player_x, player_y,
+                                 history_xs + base, history_ys + base, count,
+                                 momentum_bonus, backtrack_penalty, &new_x, &new_y)
+            if not moved:
+                continue
+
+        if count == memory_length:
+            for j in range(count - 1):
+                history_xs[base + j] = history_xs[base + j + 1]
+                history_ys[base + j] = history_ys[base + j + 1]
+            count -= 1
+        history_xs[base + count] = x
+        history_ys[base + count] = y
+        history_lens[i] = count + 1
+
+        xs[i] = new_x
+        ys[i] = new_y
+
+def find_enemy_at(array.array xs, array.array ys, int x, int y):
+    cdef int *enemy_xs = xs.data.as_ints
+    cdef int *enemy_ys = ys.data.as_ints
+    cdef Py_ssize_t i, n = len(xs)
+    for i in range(n):
+        if enemy_xs[i] == x and enemy_ys[i] == y:
+            return i
+    return -1
+
+def bucket_enemies(array.array xs, array.array ys, Py_ssize_t start, Py_ssize_t stop,
+                   int player_x, int player_y, radii, list buckets):
+    cdef int *enemy_xs = xs.data.as_ints
+    cdef int *enemy_ys = ys.data.as_ints
+    cdef int tiers = len(radii)
+    cdef int *tier_radii = <int *> malloc(tiers * sizeof(int))
+    cdef Py_ssize_t i, size
+    cdef int tier, distance, dy
+    cdef list phases
+    cdef array.array bucket
+
+    if tier_radii == NULL:
+        raise MemoryError()
+    try:
+        for tier in range(tiers):
+            tier_radii[tier] = radii[tier]
+
+        for i in range(start, stop):
+            distance = abs(enemy_xs[i] - player_x)
+            dy = abs(enemy_ys[i] - player_y)
+            if dy > distance:
+                distance = dy
+
+            tier = 0
+            while tier < tiers - 1 and tier_radii[tier] != -1 and distance > tier_radii[tier]:
+                tier += 1
+
+            phases = buckets[tier]
+            bucket = phases[i % len(phases)]
+            size = len(bucket)
+            array.resize_smart(bucket, size + 1)
+            bucket.data.as_ints[size] = i
+    finally:
+        free(tier_radii)
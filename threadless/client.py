@@ -0,0 +1,114 @@
+'''Thin client for threadless.server.
+
+Forwards key presses to the server and draws whatever entities it reports.  Run it
+with:
+
+    python -m threadless.client [host [port]]
+'''
+
+from __future__ import print_function
+
+import curses
+import errno
+import select
+import socket
+import sys
+
+from threadless.__main__ import FRAME_RATE
+from threadless import protocol
+
+class Client(object):
+    def __init__(self, sock, width, height):
+        self.sock     = sock
+        self.entities = {} # entity id -> (kind, x, y)
+        self.inbuf    = b''
+        self.is_dead  = False
+
+        sock.sendall(protocol.HELLO.pack(width, height))
+        sock.setblocking(0)
+
+    def send_key(self, ch):
+        self.sock.sendall(bytearray([ch]))
+
+    def receive(self, timeout):
+        '''
+            Waits up to timeout seconds for updates and applies them.  Returns False
+            once the server has hung up.
+        '''
+        ready, _, _ = select.select([ self.sock ], [], [], timeout)
+        if not ready:
+            return True
+
+        try:
+            data = self.sock.recv(65536)
+        except socket.error as e:
+            if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return True
+            raise
+        if not data:
+            return False
+
+        frames, self.inbuf = protocol.decode_frames(self.inbuf + data)
+        for flags, records in frames:
+            if flags & protocol.FLAG_DEAD:
+                self.is_dead = True
+            for eid, kind, x, y in records:
+                if kind == protocol.REMOVED:
+                    self.entities.pop(eid, None)
+                else:
+                    self.entities[eid] = (kind, x, y)
+        return True
+
+def main():
+    host = '127.0.0.1'
+    port = protocol.DEFAULT_PORT
+    if len(sys.argv) > 1:
+        host = sys.argv[1]
+    if len(sys.argv) > 2:
+        port = int(sys.argv[2])
+
+    sock   = socket.create_connection((host, port))
+    screen = curses.initscr()
+    try:
+        curses.noecho()
+        curses.cbreak()
+        screen.nodelay(1)
+        cursor_state = curses.curs_set(0)
+
+        # the server won't play on a bigger screen than this, so use the top-left
+        # corner of a huge terminal
+        height, width = screen.getmaxyx()
+        width  = min(width, protocol.MAX_SIZE[0])
+        height = min(height, protocol.MAX_SIZE[1])
+        client = Client(sock, width, height)
+
+        while client.receive(1 / FRAME_RATE):
+            ch = screen.getch()
+            if 0 <= ch < 256:
+                client.send_key(ch)
+
+            # the terminal may have shrunk since the HELLO
+            max_height, max_width = screen.getmaxyx()
+            screen.erase()
+            for kind, x, y in client.entities.values():
+                if x < max_width and y < max_height:
+                    try:
+                        screen.addch(y, x, kind)
+                    except curses.error:
+                        # drawing in the bottom-right cell works, but then moving
+                        # the cursor past the end of the window fails
+                        pass
+            screen.refresh()
+
+        curses.curs_set(cursor_state)
+    finally:
+        curses.nocbreak()
+        curses.echo()
+        curses.endwin()
+        sock.close()
+
+    if client.is_dead:
+        print("You're dead! =(")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+'''Runs many game sessions per process, and many processes per machine.
+
+A SessionHost interleaves any number of Games on one loop: each frame it ticks every
+session once and then waits out the rest of the frame.  shard() starts several
+hosts in worker processes, so sessions spread across cores without one interpreter
+per player.
+
+Without a network, the sessions are headless simulations, which is handy for
+measuring how many sessions a machine can carry:
+
+    python -m threadless.host [sessions [workers [seconds]]]
+'''
+
+from __future__ import print_function
+
+import logging
+import multiprocessing
+import sys
+import time
+
+from threadless.__main__ import FRAME_RATE, Game, HeadlessScreen, YoureDead
+
+class SessionLogger(logging.LoggerAdapter):
+    '''
+        Tags each message with the session it's about, for use as a Game's logger.
+    '''
+
+    def process(self, msg, kwargs):
+        return '[session %s] %s' % (self.extra['session'], msg), kwargs
+
+class SessionHost(object):
+    # errors raised from Game.tick() that are an expected end to a session; anything
+    # else is logged as a crash, but still ends only the offending session
+    SESSION_ERRORS = (YoureDead,)
+
+    def __init__(self):
+        self.sessions   = {} # key -> Game
+        self.is_running = True
+
+    def add_session(self, key, game):
+        self.sessions[key] = game
+        game.logger.info('started')
+
+    def end_session(self, key, error=None):
+        '''
+            Removes a session and tears its game down.  error is the exception that
+            ended it, or None if the game stopped on its own.
+        '''
+        game = self.sessions.pop(key)
+        if error is None:
+            game.logger.info('ended')
+        else:
+            game.logger.info('ended: %s', error)
+        game.teardown()
+        return game
+
+    def tick(self, deadline=None):
+        '''
+            Ticks every session once.  Whatever is left before deadline is shared
+            out between the sessions still to be ticked, as their budget for
+            generator tickers, so that the whole frame's work fits in Game.WORK_BUDGET
+            however many sessions there are.
+        '''
+        if deadline is None:
+            deadline = time.time() + Game.WORK_BUDGET
+
+        sessions = list(self.sessions.items())
+        for i, (key, game) in enumerate(sessions):
+            budget = max(deadline - time.time(), 0) / (len(sessions) - i)
+            try:
+                game.tick(budget=budget)
+            except self.SESSION_ERRORS as e:
+                self.end_session(key, e)
+            except Exception as e:
+                game.logger.exception('crashed')
+                self.end_session(key, e)
+            else:
+                if not game.is_running:
+                    self.end_session(key)
+
+    def poll(self, deadline):
+        '''
+            Called with whatever is left of each frame; waits until the deadline.
+            Subclasses with I/O to do service it here.
+        '''
+        wait_time = deadline - time.time()
+        if wait_time > 0:
+            time.sleep(wait_time)
+
+    def serve_forever(self):
+        seconds_per_frame = 1 / FRAME_RATE
+
+        try:
+            while self.is_running:
+                start = time.time()
+                self.tick(start + Game.WORK_BUDGET)
+                self.poll(start + seconds_per_frame)
+        finally:
+            self.teardown()
+
+    def stop_running(self):
+        self.is_running = False
+
+    def teardown(self):
+        for key in list(self.sessions):
+            self.end_session(key)
+
+def shard(target, worker_args):
+    '''
+        Runs target(*args) in a separate worker process for each args tuple in
+        worker_args, and waits for them all.  target is expected to build a
+        SessionHost and serve it.
+    '''
+    processes = [
+        multiprocessing.Process(target=target, args=args) for args in worker_args
+    ]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
+def run_headless(sessions, seconds, results=None):
+    '''
+        Simulates `sessions` headless games for `seconds` seconds, and reports the
+        number of frames achieved per second to results (a multiprocessing queue),
+        if given.
+    '''
+    host = SessionHost()
+    for i in range(sessions):
+        logger = SessionLogger(logging.getLogger('threadless.session'), { 'session': i })
+        host.add_session(i, Game(screen=HeadlessScreen(), seed=i, logger=logger))
+
+    frames = 0
+    end    = time.time() + seconds
+    seconds_per_frame = 1 / FRAME_RATE
+    try:
+        while host.sessions and time.time() < end:
+            start = time.time()
+            host.tick(start + Game.WORK_BUDGET)
+            host.poll(start + seconds_per_frame)
+            frames += 1
+    finally:
+        host.teardown()
+
+    if results is not None:
+        results.put(frames / float(seconds))
+
+def main():
+    sessions = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    workers  = int(sys.argv[2]) if len(sys.argv) > 2 else multiprocessing.cpu_count()
+    seconds  = int(sys.argv[3]) if len(sys.argv) > 3 else 10
+
+    results = multiprocessing.Queue()
+    per_worker, extra = divmod(sessions, workers)
+    worker_args = [
+        (per_worker + (1 if i < extra else 0), seconds, results)
+        for i in range(min(workers, sessions))
+    ]
+    shard(run_headless, worker_args)
+
+    for i in range(len(worker_args)):
+        print('worker %d: %.1f frames/s (target %.1f)' % (i, results.get(), FRAME_RATE))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+'''Wire format shared by threadless.server and threadless.client.
+
+A client opens a TCP connection and sends a HELLO (its terminal width and height).
+After that every byte it sends is a single key press, using the same characters as
+the curses frontend ('w', 'a', 's', 'd', 'e', 'q').  The server refuses a HELLO
+whose size is outside MIN_SIZE..MAX_SIZE by closing the connection.
+
+The server answers with frames.  A frame is a FRAME header followed by `count`
+RECORDs, one per entity whose state changed since the previous frame.  A record
+whose kind is REMOVED tells the client to forget that entity.
+'''
+
+import struct
+
+DEFAULT_PORT = 7414
+
+HELLO  = struct.Struct('!HH')   # width, height
+FRAME  = struct.Struct('!BH')   # flags, record count
+RECORD = struct.Struct('!IcHH') # entity id, kind, x, y
+
+# the smallest and largest (width, height) a session can be played at
+MIN_SIZE = (3, 2)
+MAX_SIZE = (512, 512)
+
+FLAG_DEAD = 1
+
+REMOVED = b' '
+
+# a single frame can't describe more than this many changes; larger deltas are
+# split across several frames
+MAX_RECORDS = 0xffff
+
+def encode_frames(records, flags=0):
+    '''
+        Encodes a list of (entity_id, kind, x, y) tuples into one or more frames.
+        Returns an empty string if there's nothing to send.
+    '''
+    if not records and not flags:
+        return b''
+
+    chunks = []
+    for start in range(0, max(len(records), 1), MAX_RECORDS):
+        batch = records[start:start + MAX_RECORDS]
+        chunks.append(FRAME.pack(flags, len(batch)))
+        for record in batch:
+            chunks.append(RECORD.pack(*record))
+    return b''.join(chunks)
+
+def decode_frames(buf):
+    '''
+        Decodes as many complete frames as are available in buf.  Returns a list of
+        (flags, records) pairs and the unconsumed tail of the buffer.
+    '''
+    frames = []
+    offset = 0
+    while len(buf) - offset >= FRAME.size:
+        flags, count = FRAME.unpack_from(buf, offset)
+        end = offset + FRAME.size + count * RECORD.size
+        if len(buf) < end:
+            break
+        records = [
+            RECORD.unpack_from(buf, pos)
+            for pos in range(offset + FRAME.size, end, RECORD.size)
+        ]
+        frames.append((flags, records))
+        offset = end
+    return frames, buf[offset:]
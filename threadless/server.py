@@ -0,0 +1,276 @@
+'''Authoritative multi-player game server.
+
+Every connected client gets its own Game, simulated here; the client only sends key
+presses and renders what it's told.  All sessions in a worker are ticked from a
+single select() loop, so an idle server costs nothing and a busy one costs one
+Game.tick() per session per frame.  Workers share one listening socket, and each
+accepts whichever connections it gets to first.
+
+Run it with:
+
+    python -m threadless.server [port [workers]]
+
+and connect with threadless.client.
+'''
+
+from __future__ import print_function
+
+import errno
+import logging
+import select
+import socket
+import sys
+import time
+
+from threadless.__main__ import CursesScreen, Game, Screen, YoureDead
+from threadless.host import SessionHost, SessionLogger, shard
+from threadless import protocol
+
+class NetworkScreen(Screen):
+    '''
+        A Screen that renders to a remote client.  Rather than drawing, it diffs each
+        frame against what the client was last sent and queues only the changes.
+    '''
+
+    KEY_MAP = CursesScreen.KEY_MAP
+
+    # a client that falls this far behind is dropped rather than buffered forever
+    MAX_PENDING_BYTES = 1 << 20
+
+    def __init__(self, sock, width, height):
+        self.sock   = sock
+        self.width  = width
+        self.height = height
+
+        self.keybindings = {}
+        self.objects     = []
+        self.object_ids  = {} # id(obj) -> entity id
+        self.next_id     = 0
+        self.sent        = {} # entity id -> (kind, x, y) as last sent
+        self.keys        = bytearray()
+        self.outbuf      = b''
+
+    def render(self, frame):
+        records    = []
+        sent       = self.sent
+        seen       = set()
+        object_ids = self.object_ids
+
+        for key, kind, x, y in frame.entities:
+            eid   = object_ids[key]
+            state = (kind, x, y)
+            seen.add(eid)
+            if sent.get(eid) != state:
+                sent[eid] = state
+                records.append((eid,) + state)
+
+        if len(seen) != len(sent):
+            for eid in [ eid for eid in sent if eid not in seen ]:
+                del sent[eid]
+                records.append((eid, protocol.REMOVED, 0, 0))
+
+        self.send(protocol.encode_frames(records))
+
+    def get_size(self):
+        return self.width, self.height
+
+    def on_key_down(self, key, callback):
+        key = self.KEY_MAP[key]
+        if key not in self.keybindings:
+            self.keybindings[key] = []
+        self.keybindings[key].append(callback)
+
+    def process_input(self):
+        if not self.keys:
+            return
+
+        keys      = self.keys
+        self.keys = bytearray()
+        for ch in keys:
+            for cb in self.keybindings.get(ch, []):
+                cb()
+
+    def add_object(self, obj):
+        self.object_ids[id(obj)] = self.next_id
+        self.next_id += 1
+        self.objects.append(obj)
+
+    def remove_objects(self, objs):
+        super(NetworkScreen, self).remove_objects(objs)
+        for obj in objs:
+            self.object_ids.pop(id(obj), None)
+
+    def feed(self, data):
+        '''
+            Queues raw key presses received from the client.
+        '''
+        self.keys.extend(data)
+
+    def send_death(self):
+        self.send(protocol.encode_frames([], flags=protocol.FLAG_DEAD))
+
+    def send(self, data):
+        self.outbuf += data
+        self.flush()
+
+    def flush(self):
+        if not self.outbuf:
+            return
+        try:
+            sent = self.sock.send(self.outbuf)
+        except socket.error as e:
+            if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+                sent = 0
+            else:
+                raise
+        self.outbuf = self.outbuf[sent:]
+        if len(self.outbuf) > self.MAX_PENDING_BYTES:
+            raise socket.error(errno.ENOBUFS, 'client is too far behind')
+
+    def teardown(self):
+        self.sock.close()
+
+
+def listen(host='127.0.0.1', port=protocol.DEFAULT_PORT):
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind((host, port))
+    listener.listen(64)
+    return listener
+
+
+class GameServer(SessionHost):
+    SESSION_ERRORS = (YoureDead, socket.error)
+
+    def __init__(self, host='127.0.0.1', port=protocol.DEFAULT_PORT, listener=None):
+        super(GameServer, self).__init__()
+
+        if listener is None:
+            listener = listen(host, port)
+        listener.setblocking(0)
+        self.listener = listener
+
+        self.handshakes = {} # socket -> partial HELLO
+        self.session_id = 0
+
+    def getport(self):
+        return self.listener.getsockname()[1]
+
+    def end_session(self, sock, error=None):
+        screen = self.sessions[sock].screen
+        try:
+            if isinstance(error, YoureDead):
+                screen.send_death()
+            else:
+                screen.flush()
+        except socket.error:
+            pass
+        return super(GameServer, self).end_session(sock, error)
+
+    def poll(self, deadline):
+        '''
+            Services network I/O until the deadline passes.
+        '''
+        while True:
+            timeout = max(deadline - time.time(), 0)
+            readable = [ self.listener ] + list(self.handshakes) + list(self.sessions)
+            ready, _, _ = select.select(readable, [], [], timeout)
+            for sock in ready:
+                if sock is self.listener:
+                    self.accept()
+                else:
+                    self.read(sock)
+            if time.time() >= deadline:
+                break
+
+    def accept(self):
+        try:
+            sock, _ = self.listener.accept()
+        except socket.error as e:
+            # with several workers sharing a listener, another one may have won
+            if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return
+            raise
+        sock.setblocking(0)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.handshakes[sock] = b''
+
+    def read(self, sock):
+        try:
+            data = sock.recv(4096)
+        except socket.error as e:
+            if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return
+            data = b''
+
+        if not data:
+            self.close(sock)
+        elif sock in self.sessions:
+            self.sessions[sock].screen.feed(data)
+        else:
+            self.handshake(sock, self.handshakes[sock] + data)
+
+    def handshake(self, sock, data):
+        if len(data) < protocol.HELLO.size:
+            self.handshakes[sock] = data
+            return
+
+        del self.handshakes[sock]
+        width, height = protocol.HELLO.unpack_from(data)
+        min_width, min_height = protocol.MIN_SIZE
+        max_width, max_height = protocol.MAX_SIZE
+        if not (min_width <= width <= max_width and min_height <= height <= max_height):
+            logging.getLogger('threadless.session').warning(
+                'refusing a %dx%d screen', width, height)
+            sock.close()
+            return
+
+        screen = NetworkScreen(sock, width, height)
+        screen.feed(data[protocol.HELLO.size:])
+
+        self.session_id += 1
+        logger = SessionLogger(logging.getLogger('threadless.session'), { 'session': self.session_id })
+        self.add_session(sock, Game(screen=screen, logger=logger))
+
+    def close(self, sock):
+        if sock in self.sessions:
+            self.end_session(sock)
+        else:
+            self.handshakes.pop(sock, None)
+            sock.close()
+
+    def teardown(self):
+        super(GameServer, self).teardown()
+        for sock in list(self.handshakes):
+            self.close(sock)
+        self.listener.close()
+
+def serve(listener):
+    server = GameServer(listener=listener)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(process)d %(levelname)s %(message)s')
+
+    port    = protocol.DEFAULT_PORT
+    workers = 1
+    if len(sys.argv) > 1:
+        port = int(sys.argv[1])
+    if len(sys.argv) > 2:
+        workers = int(sys.argv[2])
+
+    listener = listen(port=port)
+    print('listening on port %d with %d worker(s)' % (listener.getsockname()[1], workers))
+    if workers == 1:
+        serve(listener)
+    else:
+        try:
+            shard(serve, [ (listener,) ] * workers)
+        except KeyboardInterrupt:
+            pass
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+'''Hot paths for movement and enemy AI.
+
+These work on a BlockGrid's bitmap and a Crowd's position arrays rather than on the
+Game, so that they can be compiled: threadless/_speedups.pyx has the same functions
+in Cython, and is used in place of the pure Python versions here when it has been
+built:
+
+    python setup.py build_ext --inplace
+
+`compiled` tells you which you've got.  The pure Python versions are always
+available with a py_ prefix, so the two can be compared.
+'''
+
+import math
+
+# in the order calculate_next_move breaks ties
+DIRECTIONS = ((-1, 0), (1, 0), (0, -1), (0, 1))
+
+def py_permit_movement(cells, width, height, x, y):
+    if x < 0 or x >= width - 1:
+        return False
+
+    if y < 0 or y >= height:
+        return False
+
+    return not cells[y * width + x]
+
+def py_calculate_next_move(cells, width, height, x, y, player_x, player_y,
+                        previous_positions, momentum_bonus, backtrack_penalty):
+    best_move  = None
+    best_score = None
+
+    for dx, dy in DIRECTIONS:
+        new_x = x + dx
+        new_y = y + dy
+        if not py_permit_movement(cells, width, height, new_x, new_y):
+            continue
+
+        score = math.sqrt(abs(new_x - player_x) ** 2 + abs(new_y - player_y) ** 2)
+
+        if previous_positions:
+            previous_position = previous_positions[-1]
+            if abs(previous_position[0] - new_x) == 2 or abs(previous_position[1] - new_y) == 2:
+                score -= momentum_bonus
+
+        for prev_x, prev_y in previous_positions:
+            if new_x == prev_x and new_y == prev_y:
+                score += backtrack_penalty
+                break # we might weight positions further back differently
+
+        if best_score is None or score < best_score:
+            best_move  = [new_x, new_y]
+            best_score = score
+
+    return best_move
+
+def py_move_enemies(cells, width, height, crowd, indices, start, stop,
+                    player_x, player_y, smart, momentum_bonus, backtrack_penalty):
+    '''
+        Moves each enemy whose index is in indices[start:stop] a step towards the
+        player, and remembers where it came from.  Smart enemies use
+        calculate_next_move; the rest step straight at the player, and only fall
+        back to calculate_next_move when that's blocked.
+    '''
+    xs, ys = crowd.xs, crowd.ys
+    history_xs, history_ys = crowd.history_xs, crowd.history_ys
+    history_lens  = crowd.history_lens
+    memory_length = crowd.memory_length
+
+    for n in range(start, stop):
+        i = indices[n]
+        x = xs[i]
+        y = ys[i]
+
+        move = None
+        if not smart:
+            dx = player_x - x
+            dy = player_y - y
+            if abs(dx) >= abs(dy):
+                new_x, new_y = x + (1 if dx > 0 else -1), y
+            else:
+                new_x, new_y = x, y + (1 if dy > 0 else -1)
+            if py_permit_movement(cells, width, height, new_x, new_y):
+                move = (new_x, new_y)
+
+        base  = i * memory_length
+        count = history_lens[i]
+        if move is None:
+            previous_positions = list(zip(history_xs[base:base + count], history_ys[base:base + count]))
+            move = py_calculate_next_move(cells, width, height, x, y, player_x, player_y,
+                previous_positions, momentum_bonus, backtrack_penalty)
+            if move is None:
+                continue
+
+        if count == memory_length:
+            history_xs[base:base + count - 1] = history_xs[base + 1:base + count]
+            history_ys[base:base + count - 1] = history_ys[base + 1:base + count]
+            count -= 1
+        history_xs[base + count] = x
+        history_ys[base + count] = y
+        history_lens[i] = count + 1
+
+        xs[i] = move[0]
+        ys[i] = move[1]
+
+def py_find_enemy_at(xs, ys, x, y):
+    '''
+        Returns the index of the first enemy at (x, y), or -1 if there isn't one.
+    '''
+    for i, enemy_x in enumerate(xs):
+        if enemy_x == x and ys[i] == y:
+            return i
+    return -1
+
+def py_bucket_enemies(xs, ys, start, stop, player_x, player_y, radii, buckets):
+    '''
+        Appends the index of each enemy from start to stop to its AI tier's bucket
+        in buckets: the first tier whose radius (-1 for no limit) it's within, or
+        the last.  Each tier's bucket is a list of arrays, one per phase, and
+        enemy i goes in phase i % len(phases).
+    '''
+    last = len(radii) - 1
+    for i in range(start, stop):
+        distance = max(abs(xs[i] - player_x), abs(ys[i] - player_y))
+        tier = 0
+        while tier < last and radii[tier] != -1 and distance > radii[tier]:
+            tier += 1
+        phases = buckets[tier]
+        phases[i % len(phases)].append(i)
+
+permit_movement     = py_permit_movement
+calculate_next_move = py_calculate_next_move
+move_enemies        = py_move_enemies
+find_enemy_at       = py_find_enemy_at
+bucket_enemies      = py_bucket_enemies
+
+try:
+    from threadless._speedups import permit_movement, calculate_next_move, move_enemies, \
+        find_enemy_at, bucket_enemies
+    compiled = True
+except ImportError:
+    compiled = False
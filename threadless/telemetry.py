@@ -0,0 +1,144 @@
+'''Low-overhead binary event log.
+
+Game events are packed into fixed-size records in a preallocated ring buffer, and a
+background thread writes them out in bulk, so logging an event costs a struct pack
+rather than string formatting and a write() on the game thread.  If the writer falls
+behind, the oldest unwritten records are overwritten and a DROPPED record noting how
+many were lost is written in their place, stamped with the time of the first of
+them, so the log stays in time order.
+
+Decode a log with:
+
+    python -m threadless.telemetry threadless.events
+'''
+
+from __future__ import print_function
+
+import struct
+import sys
+import threading
+import time
+
+RECORD    = struct.Struct('<dBxhhi') # timestamp, event, x, y, value
+TIMESTAMP = struct.Struct('<d')      # just the start of a RECORD
+
+SPAWN         = 1 # x, y: where the enemy appeared
+DEATH         = 2 # x, y: where the player died
+BLOCK_PLACED  = 3 # x, y: where the block went
+FRAME_OVERRUN = 4 # value: microseconds over budget
+DROPPED       = 5 # value: number of records lost
+BLOCK_REMOVED = 6 # x, y: where the block was
+
+EVENT_NAMES = {
+    SPAWN:         'spawn',
+    DEATH:         'death',
+    BLOCK_PLACED:  'block_placed',
+    FRAME_OVERRUN: 'frame_overrun',
+    DROPPED:       'dropped',
+    BLOCK_REMOVED: 'block_removed',
+}
+
+class NullEventLog(object):
+    '''
+        Discards everything; used when no event log is wanted.
+    '''
+
+    def log(self, event, x=0, y=0, value=0):
+        pass
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+class EventLog(object):
+    def __init__(self, path, capacity=8192, flush_interval=0.25):
+        self.file     = open(path, 'ab')
+        self.capacity = capacity
+        self.buf      = bytearray(capacity * RECORD.size)
+        self.head     = 0 # total records ever logged
+        self.tail     = 0 # total records handed to the writer (or dropped)
+        self.dropped  = 0
+        self.dropped_since = 0 # timestamp of the first record dropped
+
+        self.lock       = threading.Lock()
+        self.write_lock = threading.Lock()
+        self.wakeup     = threading.Event()
+        self.is_running = True
+
+        self.flush_interval = flush_interval
+        self.thread = threading.Thread(target=self.flush_forever, name='threadless-telemetry')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def log(self, event, x=0, y=0, value=0):
+        with self.lock:
+            if self.head - self.tail >= self.capacity:
+                if not self.dropped:
+                    self.dropped_since = TIMESTAMP.unpack_from(self.buf,
+                        (self.tail % self.capacity) * RECORD.size)[0]
+                self.tail    += 1
+                self.dropped += 1
+            RECORD.pack_into(self.buf, (self.head % self.capacity) * RECORD.size,
+                time.time(), event, x, y, value)
+            self.head += 1
+            pending = self.head - self.tail
+
+        if pending == self.capacity // 2:
+            self.wakeup.set()
+
+    def flush(self):
+        with self.write_lock:
+            with self.lock:
+                start = (self.tail % self.capacity) * RECORD.size
+                end   = (self.head % self.capacity) * RECORD.size
+                if self.head == self.tail:
+                    chunks = []
+                elif start < end:
+                    chunks = [ bytes(self.buf[start:end]) ]
+                else:
+                    chunks = [ bytes(self.buf[start:]), bytes(self.buf[:end]) ]
+                self.tail = self.head
+
+                dropped, self.dropped = self.dropped, 0
+                dropped_since = self.dropped_since
+
+            if dropped:
+                chunks.insert(0, RECORD.pack(dropped_since, DROPPED, 0, 0, dropped))
+            if chunks:
+                self.file.write(b''.join(chunks))
+                self.file.flush()
+
+    def flush_forever(self):
+        while self.is_running:
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            self.flush()
+
+    def close(self):
+        self.is_running = False
+        self.wakeup.set()
+        self.thread.join()
+        self.flush()
+        self.file.close()
+
+def read_events(path):
+    '''
+        Yields (timestamp, event name, x, y, value) for each record in a log.
+    '''
+    with open(path, 'rb') as f:
+        while True:
+            record = f.read(RECORD.size)
+            if len(record) < RECORD.size:
+                break
+            timestamp, event, x, y, value = RECORD.unpack(record)
+            yield timestamp, EVENT_NAMES.get(event, str(event)), x, y, value
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else 'threadless.events'
+    for timestamp, event, x, y, value in read_events(path):
+        print('%.6f %-14s %5d %5d %d' % (timestamp, event, x, y, value))
+
+if __name__ == '__main__':
+    main()